@@ -34,6 +34,8 @@ CREATE TABLE products (
     is_deleted BOOLEAN DEFAULT FALSE, -- 產品是否已刪除，預設為否
     INDEX idx_name (name), -- 為產品名稱欄位建立索引
     INDEX idx_price (price), -- 為產品價格欄位建立索引
+    INDEX idx_products_active_id (is_deleted, id), -- 複合索引，支援活躍產品的游標分頁範圍查詢
+
     CONSTRAINT chk_stock CHECK (stock >= 0) -- 檢查庫存數量必須大於或等於0
 );
 
@@ -51,9 +53,23 @@ CREATE TABLE orders (
     INDEX idx_user_id (user_id), -- 為使用者ID欄位建立索引
     INDEX idx_status (status), -- 為訂單狀態欄位建立索引
     INDEX idx_created_at (created_at), -- 為建立時間欄位建立索引
-    INDEX idx_total_amount (total_amount) -- 為訂單總金額欄位建立索引
+    INDEX idx_total_amount (total_amount), -- 為訂單總金額欄位建立索引
+    INDEX idx_orders_list (id, user_id, number, status, total_amount, created_at) -- 覆蓋索引，/api/orders 分頁查詢可走 index-only 掃描，免除逐行回表
+
 );
 
+-- Create counters table
+-- 建立計數器資料表 (反正規化統計，讓全量 COUNT/SUM 變成 O(1) 的單行讀取)
+CREATE TABLE counters (
+    name VARCHAR(32) PRIMARY KEY, -- 計數器名稱
+    value BIGINT NOT NULL DEFAULT 0, -- 累計筆數
+    amount DECIMAL(14, 2) NOT NULL DEFAULT 0.00 -- 累計金額
+);
+
+-- Seed the orders counter
+-- 初始化訂單計數器
+INSERT INTO counters (name, value, amount) VALUES ('orders', 0, 0.00);
+
 -- Create order_items table
 -- 建立訂單項目資料表
 CREATE TABLE order_items (
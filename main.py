@@ -1,343 +1,568 @@
-# main.py
-import os
-from datetime import datetime
-from math import ceil
-from typing import List, Dict, Union, Any
-
-from fastapi import FastAPI, HTTPException, status, Depends
-from pydantic import BaseModel, Field
-from dotenv import load_dotenv
-import mysql.connector
-from mysql.connector import Error
-
-# 從 .env 檔案載入環境變數
-load_dotenv()
-
-app = FastAPI(
-    title="電子商務訂單管理 API",
-    description="用於管理訂單、產品和訂單統計的 API。",
-    version="1.0.0"
-)
-
-# 資料庫連線設定
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_NAME = os.getenv("DB_NAME", "ecommerce_test")
-DB_USER = os.getenv("DB_USER", "root")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "") # 在實際生產環境中，請使用環境變數
-
-def get_db_connection():
-    """建立並回傳資料庫連線。"""
-    conn = None
-    try:
-        conn = mysql.connector.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        if conn.is_connected():
-            print("成功連接到資料庫")
-        return conn
-    except Error as e:
-        print(f"連接 MySQL 資料庫時發生錯誤: {e}")
-        # 在生產環境中，更穩健地記錄此錯誤
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="伺服器錯誤: 無法連接資料庫"
-        )
-
-# Pydantic 模型用於請求和回應驗證/序列化
-class OrderItemRequest(BaseModel):
-    product_id: int = Field(..., gt=0, description="產品 ID")
-    quantity: int = Field(..., gt=0, description="產品數量")
-
-class CreateOrderRequest(BaseModel):
-    user_id: int = Field(..., gt=0, description="下訂單的使用者 ID")
-    items: List[OrderItemRequest] = Field(..., min_items=1, description="訂單中的商品清單")
-
-class OrderResponse(BaseModel):
-    id: int
-    user_id: int
-    number: str
-    status: str
-    total_amount: float
-    created_at: datetime
-
-class OrderListResponse(BaseModel):
-    data: List[OrderResponse]
-    page: int
-    total_pages: int
-    total_items: int
-
-class ProductResponse(BaseModel):
-    id: int
-    name: str
-    price: float
-    stock: int
-
-class ProductListResponse(BaseModel):
-    data: List[ProductResponse]
-    page: int
-    total_pages: int
-    total_items: int
-
-class OrderStatsResponse(BaseModel):
-    total_orders: int
-    total_amount: float
-    today_orders: int
-    today_amount: float
-
-class UpdateOrderStatusRequest(BaseModel):
-    status: str = Field(..., pattern="^(pending|processing|shipped|delivered|cancelled)$", description="訂單的新狀態")
-
-# 依賴項，用於獲取資料庫連線並確保其關閉
-def get_db():
-    db = get_db_connection()
-    try:
-        yield db
-    finally:
-        if db:
-            db.close()
-
-# API 路由
-
-@app.get("/api/orders", response_model=OrderListResponse, summary="獲取分頁的訂單列表")
-async def get_orders(page: int = 1, limit: int = 20, db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    """
-    擷取分頁的訂單列表。
-    """
-    if limit <= 0:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="限制必須是正整數。")
-    if page <= 0:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="頁碼必須是正整數。")
-
-    offset = (page - 1) * limit
-    cursor = db.cursor(dictionary=True)
-
-    try:
-        # 獲取總數
-        cursor.execute("SELECT COUNT(*) FROM orders")
-        total_items = cursor.fetchone()['COUNT(*)']
-        total_pages = ceil(total_items / limit) if total_items > 0 else 0
-
-        # 獲取分頁訂單
-        cursor.execute(
-            "SELECT id, user_id, number, status, total_amount, created_at FROM orders LIMIT %s OFFSET %s",
-            (limit, offset)
-        )
-        orders = cursor.fetchall()
-
-        return {
-            "data": orders,
-            "page": page,
-            "total_pages": total_pages,
-            "total_items": total_items
-        }
-    except Error as e:
-        print(f"資料庫錯誤: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="伺服器錯誤: 無法獲取訂單列表")
-    finally:
-        cursor.close()
-
-
-@app.get("/api/orders/{order_id}", response_model=OrderResponse, summary="獲取單一訂單的詳細資訊")
-async def get_order_details(order_id: int, db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    """
-    根據訂單 ID 擷取特定訂單的詳細資訊。
-    """
-    cursor = db.cursor(dictionary=True)
-    try:
-        cursor.execute("SELECT id, user_id, number, status, total_amount, created_at FROM orders WHERE id = %s", (order_id,))
-        order = cursor.fetchone()
-        if not order:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="訂單不存在")
-        return order
-    except Error as e:
-        print(f"資料庫錯誤: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="伺服器錯誤: 無法獲取訂單詳情")
-    finally:
-        cursor.close()
-
-
-@app.post("/api/orders", status_code=status.HTTP_201_CREATED, summary="建立新訂單")
-async def create_order(order_data: CreateOrderRequest, db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    """
-    建立新訂單，扣除產品庫存並管理交易。
-    """
-    cursor = db.cursor()
-    try:
-        db.start_transaction()
-
-        user_id = order_data.user_id
-        # 生成唯一的訂單號 (類似 PHP 的邏輯)
-        order_number = f"ORD{datetime.now().strftime('%Y%m%d%H%M%S')}{os.urandom(2).hex()}" # 比 mt_rand 更健壯
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        # 插入 orders 表
-        cursor.execute(
-            "INSERT INTO orders (user_id, number, status, created_at, updated_at) VALUES (%s, %s, 'pending', %s, %s)",
-            (user_id, order_number, current_time, current_time)
-        )
-        order_id = cursor.lastrowid
-        if not order_id:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="無法創建訂單")
-
-        total_amount = 0.0
-
-        for item in order_data.items:
-            product_id = item.product_id
-            quantity = item.quantity
-
-            # 鎖定產品行以進行更新，防止競爭條件 (FOR UPDATE 等效)
-            # 在 mysql.connector 中，通常透過確保事務隱式持有鎖定來處理此問題，透過 UPDATE/SELECT FOR UPDATE。
-            # 這裡我們將先進行 SELECT，然後進行 UPDATE，依賴於事務。
-            cursor.execute("SELECT stock, price, is_deleted FROM products WHERE id = %s FOR UPDATE", (product_id,))
-            product = cursor.fetchone()
-
-            if not product:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"產品 ID {product_id} 不存在")
-            
-            product_stock, product_price, is_deleted = product[0], product[1], product[2] # 透過索引存取非字典游標
-
-            if is_deleted:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"產品 ID {product_id} 已停用或刪除")
-
-            if product_stock < quantity:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"產品 ID {product_id} 庫存不足。可用: {product_stock}, 需求: {quantity}")
-
-            unit_price = float(product_price)
-            subtotal = unit_price * quantity
-            total_amount += subtotal
-
-            # 更新產品庫存
-            cursor.execute(
-                "UPDATE products SET stock = stock - %s, updated_at = %s WHERE id = %s AND stock >= %s",
-                (quantity, current_time, product_id, quantity)
-            )
-            if cursor.rowcount == 0:
-                 # 如果初始檢查後庫存不足，則可能會發生這種情況，因為存在競爭條件
-                db.rollback() # 在拋出異常前明確回滾
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"產品 ID {product_id} 庫存更新失敗，可能庫存不足或並發問題")
-
-            # 插入 order_items
-            cursor.execute(
-                "INSERT INTO order_items (order_id, product_id, quantity, unit_price, subtotal, created_at, updated_at) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                (order_id, product_id, quantity, unit_price, subtotal, current_time, current_time)
-            )
-
-        # 更新 orders 表中的總金額
-        cursor.execute("UPDATE orders SET total_amount = %s WHERE id = %s", (total_amount, order_id))
-
-        db.commit()
-        return {"order_id": order_id, "order_number": order_number}
-
-    except HTTPException as e:
-        db.rollback()
-        raise e # 重新拋出 FastAPI HTTPException
-    except Error as e:
-        db.rollback()
-        print(f"訂單創建期間的資料庫錯誤: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"伺服器錯誤: 無法創建訂單。詳細錯誤: {e}" # 開發環境中更詳細，生產環境中更通用
-        )
-    except Exception as e:
-        db.rollback()
-        print(f"訂單創建期間發生意外錯誤: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"伺服器錯誤: {e}")
-    finally:
-        cursor.close()
-
-
-@app.put("/api/orders/{order_id}/status", summary="更新訂單狀態")
-async def update_order_status(order_id: int, status_data: UpdateOrderStatusRequest, db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    """
-    更新特定訂單的狀態。
-    允許的狀態: 'pending'、'processing'、'shipped'、'delivered'、'cancelled'。
-    """
-    cursor = db.cursor()
-    try:
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        cursor.execute(
-            "UPDATE orders SET status = %s, updated_at = %s WHERE id = %s",
-            (status_data.status, current_time, order_id)
-        )
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="訂單不存在或狀態已是目標狀態")
-        db.commit()
-        return {"success": True, "message": "訂單狀態更新成功"}
-    except Error as e:
-        db.rollback()
-        print(f"資料庫錯誤: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="伺服器錯誤: 無法更新訂單狀態")
-    finally:
-        cursor.close()
-
-
-@app.get("/api/orders/stats", response_model=OrderStatsResponse, summary="獲取訂單統計")
-async def get_order_stats(db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    """
-    擷取訂單的聚合統計資訊，包括總訂單數、總金額、今日訂單數和今日金額。
-    """
-    cursor = db.cursor(dictionary=True)
-    try:
-        cursor.execute("""
-            SELECT
-                (SELECT COUNT(*) FROM orders) as total_orders,
-                (SELECT COALESCE(SUM(total_amount), 0) FROM orders) as total_amount,
-                (SELECT COUNT(*) FROM orders WHERE DATE(created_at) = CURDATE()) as today_orders,
-                (SELECT COALESCE(SUM(total_amount), 0) FROM orders WHERE DATE(created_at) = CURDATE()) as today_amount
-        """)
-        stats = cursor.fetchone()
-
-        # 確保正確的類型並處理如果沒有訂單時總和可能為 None 的情況
-        return OrderStatsResponse(
-            total_orders=int(stats['total_orders']),
-            total_amount=float(stats['total_amount']),
-            today_orders=int(stats['today_orders']),
-            today_amount=float(stats['today_amount'])
-        )
-    except Error as e:
-        print(f"資料庫錯誤: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="伺服器錯誤: 無法獲取訂單統計")
-    finally:
-        cursor.close()
-
-
-@app.get("/api/products", response_model=ProductListResponse, summary="獲取分頁的產品列表")
-async def get_products(page: int = 1, limit: int = 50, db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    """
-    擷取活躍產品 (is_deleted = FALSE) 的分頁列表。
-    """
-    if limit <= 0:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="限制必須是正整數。")
-    if page <= 0:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="頁碼必須是正整數。")
-
-    offset = (page - 1) * limit
-    cursor = db.cursor(dictionary=True)
-
-    try:
-        # 獲取活躍產品的總數
-        cursor.execute("SELECT COUNT(*) FROM products WHERE is_deleted = FALSE")
-        total_items = cursor.fetchone()['COUNT(*)']
-        total_pages = ceil(total_items / limit) if total_items > 0 else 0
-
-        # 獲取分頁產品
-        cursor.execute(
-            "SELECT id, name, price, stock FROM products WHERE is_deleted = FALSE LIMIT %s OFFSET %s",
-            (limit, offset)
-        )
-        products = cursor.fetchall()
-
-        return {
-            "data": products,
-            "page": page,
-            "total_pages": total_pages,
-            "total_items": total_items
-        }
-    except Error as e:
-        print(f"資料庫錯誤: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="伺服器錯誤: 無法獲取產品列表")
-    finally:
-        cursor.close()
+# main.py
+import asyncio
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from datetime import datetime
+from functools import lru_cache
+from math import ceil
+from typing import Annotated, List, Dict, Optional, Union, Any
+
+import msgspec
+from fastapi import FastAPI, HTTPException, Query, Request, status, Depends
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
+from dotenv import load_dotenv
+import asyncmy
+from asyncmy.cursors import DictCursor
+from asyncmy.errors import MySQLError as Error
+
+# 從 .env 檔案載入環境變數
+load_dotenv()
+
+# 日誌經由佇列交給背景執行緒寫出，熱路徑上不做同步 stdout I/O (print 會阻塞事件迴圈)
+logger = logging.getLogger(__name__)
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, logging.StreamHandler(), respect_handler_level=True
+)
+
+def _setup_logging() -> None:
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(_log_queue))
+    root.setLevel(logging.WARNING)
+    _log_listener.start()
+
+app = FastAPI(
+    title="電子商務訂單管理 API",
+    description="用於管理訂單、產品和訂單統計的 API。",
+    version="1.0.0",
+    default_response_class=ORJSONResponse  # orjson 以 C 實作序列化 (含 datetime)，比預設 json 快數倍
+)
+
+# 列表回應的 JSON 鍵名高度重複，gzip 壓縮率可達 5~10 倍；小於 1 KB 的回應不值得壓縮
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# 資料庫連線設定
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_NAME = os.getenv("DB_NAME", "ecommerce_test")
+DB_USER = os.getenv("DB_USER", "root")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "") # 在實際生產環境中，請使用環境變數
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "5"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "25"))
+
+
+@app.on_event("startup")
+async def create_db_pool():
+    """在應用啟動時設定日誌並建立非同步連線池，查詢期間事件迴圈可處理其他請求。"""
+    _setup_logging()
+    app.state.pool = await asyncmy.create_pool(
+        host=DB_HOST,
+        db=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        minsize=DB_POOL_MIN_SIZE,
+        maxsize=DB_POOL_SIZE,
+        # 必須開啟 autocommit：autocommit=0 時連 SELECT 都會開啟隱式事務，
+        # 歸還時 asyncmy 會直接關閉帶著未結束事務的連線而非回收，連線池形同虛設。
+        # create_order 以明確的 await db.begin() 開啟寫入事務，不受此設定影響
+        autocommit=True
+    )
+
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    """在應用關閉時釋放連線池並停止日誌背景執行緒。"""
+    app.state.pool.close()
+    await app.state.pool.wait_closed()
+    _log_listener.stop()
+
+# 建單請求改用 msgspec.Struct：解碼與驗證在 C 層一次完成，
+# 項目數多時比 Pydantic 逐欄位的 Python 分派快數倍
+class OrderItemRequest(msgspec.Struct):
+    product_id: Annotated[int, msgspec.Meta(gt=0)]  # 產品 ID
+    quantity: Annotated[int, msgspec.Meta(gt=0)]  # 產品數量
+
+class CreateOrderRequest(msgspec.Struct):
+    user_id: Annotated[int, msgspec.Meta(gt=0)]  # 下訂單的使用者 ID
+    items: Annotated[List[OrderItemRequest], msgspec.Meta(min_length=1)]  # 訂單中的商品清單
+
+# 解碼器預先編譯一次，逐請求呼叫時零額外建構成本
+_decode_create_order = msgspec.json.Decoder(CreateOrderRequest).decode
+
+class OrderResponse(BaseModel):
+    id: int
+    user_id: int
+    number: str
+    status: str
+    total_amount: float
+    created_at: datetime
+
+class OrderListResponse(BaseModel):
+    data: List[OrderResponse]
+    page: int
+    total_pages: Optional[int] = None
+    total_items: Optional[int] = None
+    next_cursor: Optional[int] = None
+
+class ProductResponse(BaseModel):
+    id: int
+    name: str
+    price: float
+    stock: int
+
+class ProductListResponse(BaseModel):
+    data: List[ProductResponse]
+    page: int
+    total_pages: Optional[int] = None
+    total_items: Optional[int] = None
+    next_cursor: Optional[int] = None
+
+class OrderStatsResponse(BaseModel):
+    total_orders: int
+    total_amount: float
+    today_orders: int
+    today_amount: float
+
+class UpdateOrderStatusRequest(BaseModel):
+    status: str = Field(..., pattern="^(pending|processing|shipped|delivered|cancelled)$", description="訂單的新狀態")
+
+# 依賴項，用於自連線池取得連線並在請求結束時自動歸還
+async def get_db():
+    async with app.state.pool.acquire() as conn:
+        yield conn
+
+# 熱路徑 SQL 統一定義於模組層級：語句文字只組裝一次，每次送出的位元組完全相同，
+# 讓 MySQL 的語句摘要與 ProxySQL 之類中介層的快取可直接命中
+# (asyncmy 走文字協定，未提供伺服器端預備語句 API)
+SQL_ORDERS_PAGE = (
+    "SELECT id, user_id, number, status, total_amount, created_at "
+    "FROM orders ORDER BY id LIMIT %s OFFSET %s"
+)
+SQL_ORDERS_KEYSET = (
+    "SELECT id, user_id, number, status, total_amount, created_at "
+    "FROM orders WHERE id < %s ORDER BY id DESC LIMIT %s"
+)
+SQL_ORDER_BY_ID = "SELECT id, user_id, number, status, total_amount, created_at FROM orders WHERE id = %s"
+# 時間戳由 MySQL 端的 NOW() 填入，省去在 Python 格式化字串並隨每條語句傳輸的成本；
+# total_amount 於插入時一併寫入，省去對剛插入行的補寫 UPDATE
+SQL_INSERT_ORDER = (
+    "INSERT INTO orders (user_id, number, status, total_amount, created_at, updated_at) "
+    "VALUES (%s, %s, 'pending', %s, NOW(), NOW())"
+)
+SQL_UPDATE_ORDER_STATUS = "UPDATE orders SET status = %s, updated_at = NOW() WHERE id = %s"
+# 全量統計讀取 counters 反正規化計數器 (O(1) 單行)，取代對 orders 全表的 COUNT/SUM；
+# 今日統計保留索引範圍掃描，跨日歸零與行程重啟皆不受影響。
+# 今日條件寫成 created_at 範圍比較，讓 MySQL 能走 idx_created_at 索引
+# (DATE(created_at) = CURDATE() 對每一行套用函數，無法使用索引)
+SQL_ORDER_COUNTER = "SELECT value, amount FROM counters WHERE name = 'orders'"
+SQL_BUMP_ORDER_COUNTER = (
+    "INSERT INTO counters (name, value, amount) VALUES ('orders', 1, %s) "
+    "ON DUPLICATE KEY UPDATE value = value + 1, amount = amount + VALUES(amount)"
+)
+SQL_ORDER_STATS_TODAY = (
+    "SELECT COUNT(*) as today_orders, COALESCE(SUM(total_amount), 0) as today_amount "
+    "FROM orders WHERE created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY"
+)
+SQL_PRODUCTS_PAGE = (
+    "SELECT id, name, price, stock, COUNT(*) OVER() AS total_items "
+    "FROM products WHERE is_deleted = FALSE ORDER BY id LIMIT %s OFFSET %s"
+)
+SQL_PRODUCTS_PAGE_NO_TOTAL = (
+    "SELECT id, name, price, stock "
+    "FROM products WHERE is_deleted = FALSE ORDER BY id LIMIT %s OFFSET %s"
+)
+SQL_PRODUCTS_KEYSET = (
+    "SELECT id, name, price, stock "
+    "FROM products WHERE is_deleted = FALSE AND id < %s ORDER BY id DESC LIMIT %s"
+)
+
+# /api/products 的行程內 TTL 快取：目錄變動緩慢，命中時完全不觸碰資料庫。
+# create_order 扣減庫存後提升版本號，使所有既有項目立即失效
+PRODUCTS_CACHE_TTL = float(os.getenv("PRODUCTS_CACHE_TTL", "30"))
+PRODUCTS_CACHE_MAX = 256
+_products_cache: Dict[tuple, tuple] = {}  # key -> (到期時間, 回應內容)
+_products_cache_version = 0
+
+def _bump_products_cache_version() -> None:
+    global _products_cache_version
+    _products_cache_version += 1
+
+def _store_products_cache(key: tuple, payload: Dict[str, Any]) -> None:
+    if len(_products_cache) >= PRODUCTS_CACHE_MAX:
+        _products_cache.clear()  # 簡單的全清淘汰，對短 TTL 的小快取已足夠
+    _products_cache[key] = (time.monotonic() + PRODUCTS_CACHE_TTL, payload)
+
+# 訂單號生成：奈秒時間戳 + 行程內序號 (snowflake 風格)，單調遞增且不需系統呼叫；
+# orders.number 的 UNIQUE 約束仍是最終防線
+_ORDER_PREFIX = "ORD"
+_ORDER_SEQ = itertools.count()
+
+# 列表端點使用元組游標並以下列輔助函數手組 dict：省去 DictCursor 逐行配置 dict 的
+# 成本，並直接回傳 ORJSONResponse 跳過 Pydantic 對 DB 已定型資料的重複驗證
+def _order_row(r) -> Dict[str, Any]:
+    return {"id": r[0], "user_id": r[1], "number": r[2], "status": r[3],
+            "total_amount": float(r[4]), "created_at": r[5]}
+
+def _product_row(r) -> Dict[str, Any]:
+    return {"id": r[0], "name": r[1], "price": float(r[2]), "stock": r[3]}
+
+@lru_cache(maxsize=128)
+def _select_products_sql(n: int) -> str:
+    """依產品數量快取 create_order 的 IN 查詢語句，避免每張訂單重組字串。"""
+    placeholders = ",".join(["%s"] * n)
+    return f"SELECT id, stock, price, is_deleted FROM products WHERE id IN ({placeholders}) ORDER BY id"
+
+@lru_cache(maxsize=128)
+def _insert_order_items_sql(n: int) -> str:
+    """依項目數量快取 order_items 的多值 INSERT 語句，保證一次往返寫入全部項目。"""
+    values = ",".join(["(%s, %s, %s, %s, %s, NOW(), NOW())"] * n)
+    return (
+        "INSERT INTO order_items (order_id, product_id, quantity, unit_price, subtotal, created_at, updated_at) "
+        f"VALUES {values}"
+    )
+
+@lru_cache(maxsize=128)
+def _update_stock_sql(n: int) -> str:
+    """依產品數量快取批次扣庫存語句 (CASE 分支數固定於 n)。"""
+    placeholders = ",".join(["%s"] * n)
+    case_branches = " ".join(["WHEN %s THEN %s"] * n)
+    return (
+        f"UPDATE products SET stock = stock - CASE id {case_branches} END, updated_at = NOW() "
+        f"WHERE id IN ({placeholders}) AND is_deleted = FALSE AND stock >= CASE id {case_branches} END"
+    )
+
+# API 路由
+
+@app.get("/api/orders", response_model=OrderListResponse, summary="獲取分頁的訂單列表")
+async def get_orders(page: int = Query(1, gt=0, description="頁碼"), limit: int = Query(20, gt=0, le=200, description="每頁筆數"), after_id: Optional[int] = None, include_total: bool = False, db: asyncmy.Connection = Depends(get_db)):
+    """
+    擷取分頁的訂單列表。
+    傳入 after_id 可改用游標分頁：只回傳 id 小於 after_id 的訂單與 next_cursor。
+    需要總數/總頁數的客戶端請帶 include_total=true，預設省略總數查詢。
+    page/limit 的範圍驗證由 Query 約束在進入處理函數前完成，limit 上限 200。
+    """
+    offset = (page - 1) * limit
+
+    try:
+        if after_id is not None:
+            # 游標 (keyset) 分頁：主鍵範圍查詢取代 OFFSET 掃描，深頁成本恆為 O(limit)
+            async with db.cursor() as cursor:
+                await cursor.execute(SQL_ORDERS_KEYSET, (after_id, limit))
+                rows = await cursor.fetchall()
+
+            return ORJSONResponse({
+                "data": [_order_row(r) for r in rows],
+                "page": page,
+                "total_pages": None,
+                "total_items": None,
+                "next_cursor": rows[-1][0] if rows else None
+            })
+
+        total_items = total_pages = None
+        async with db.cursor() as cursor:
+            if include_total:
+                # 總數改讀 counters 計數器：O(1) 單行讀取，取代隨資料量成長的 COUNT(*) 掃描
+                await cursor.execute(SQL_ORDER_COUNTER)
+                counter = await cursor.fetchone()
+                total_items = int(counter[0]) if counter else 0
+                total_pages = ceil(total_items / limit) if total_items > 0 else 0
+
+            # 獲取分頁訂單
+            await cursor.execute(SQL_ORDERS_PAGE, (limit, offset))
+            rows = await cursor.fetchall()
+
+        return ORJSONResponse({
+            "data": [_order_row(r) for r in rows],
+            "page": page,
+            "total_pages": total_pages,
+            "total_items": total_items,
+            "next_cursor": None
+        })
+    except Error:
+        logger.exception("獲取訂單列表時發生資料庫錯誤")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="伺服器錯誤: 無法獲取訂單列表")
+
+
+# /api/orders/stats 的行程內快取：儀表板輪詢在 TTL 視窗內只需打一次資料庫
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "10"))
+_stats_cache: Dict[str, Any] = {"expires": 0.0, "value": None}
+_stats_lock = asyncio.Lock()
+
+
+async def _fetch_order_counter():
+    """自 counters 讀取全量統計 (O(1) 單行)，使用獨立的池連線以便並行。"""
+    async with app.state.pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(SQL_ORDER_COUNTER)
+            return await cursor.fetchone()
+
+
+async def _fetch_today_stats():
+    """以 idx_created_at 範圍掃描取得今日統計，使用獨立的池連線以便並行。"""
+    async with app.state.pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(SQL_ORDER_STATS_TODAY)
+            return await cursor.fetchone()
+
+
+# 注意：/api/orders/stats 必須先於 /api/orders/{order_id} 註冊，
+# 否則會被路徑參數路由攔截，"stats" 過不了 int 驗證而一律回 422
+@app.get("/api/orders/stats", response_model=OrderStatsResponse, summary="獲取訂單統計")
+async def get_order_stats():
+    """
+    擷取訂單的聚合統計資訊，包括總訂單數、總金額、今日訂單數和今日金額。
+    結果於行程內快取 STATS_CACHE_TTL 秒 (預設 10 秒)。
+    """
+    if _stats_cache["value"] is not None and time.monotonic() < _stats_cache["expires"]:
+        return _stats_cache["value"]
+
+    async with _stats_lock:
+        # 拿到鎖後再檢查一次，避免同時湧入的請求重複查詢 (cache stampede)
+        if _stats_cache["value"] is not None and time.monotonic() < _stats_cache["expires"]:
+            return _stats_cache["value"]
+
+        try:
+            # 兩條查詢各自取用池連線並行執行，等待時間為 max 而非 sum
+            async with asyncio.TaskGroup() as tg:
+                counter_task = tg.create_task(_fetch_order_counter())
+                today_task = tg.create_task(_fetch_today_stats())
+            counter = counter_task.result()
+            today = today_task.result()
+
+            # 確保正確的類型並處理計數器尚未初始化或總和為 None 的情況
+            response = OrderStatsResponse(
+                total_orders=int(counter[0]) if counter else 0,
+                total_amount=float(counter[1]) if counter else 0.0,
+                today_orders=int(today[0]),
+                today_amount=float(today[1])
+            )
+            _stats_cache["value"] = response
+            _stats_cache["expires"] = time.monotonic() + STATS_CACHE_TTL
+            return response
+        except Exception:
+            # TaskGroup 會把子任務的 Error 包成 ExceptionGroup，統一在此攔截
+            logger.exception("獲取訂單統計時發生資料庫錯誤")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="伺服器錯誤: 無法獲取訂單統計")
+
+
+@app.get("/api/orders/{order_id}", response_model=OrderResponse, summary="獲取單一訂單的詳細資訊")
+async def get_order_details(order_id: int, db: asyncmy.Connection = Depends(get_db)):
+    """
+    根據訂單 ID 擷取特定訂單的詳細資訊。
+    """
+    try:
+        async with db.cursor(DictCursor) as cursor:
+            await cursor.execute(SQL_ORDER_BY_ID, (order_id,))
+            order = await cursor.fetchone()
+        if not order:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="訂單不存在")
+        return order
+    except Error:
+        logger.exception("獲取訂單詳情時發生資料庫錯誤")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="伺服器錯誤: 無法獲取訂單詳情")
+
+
+@app.post("/api/orders", status_code=status.HTTP_201_CREATED, summary="建立新訂單")
+async def create_order(request: Request, db: asyncmy.Connection = Depends(get_db)):
+    """
+    建立新訂單，扣除產品庫存並管理交易。
+    請求主體: {"user_id": int > 0, "items": [{"product_id": int > 0, "quantity": int > 0}, ...]} (items 至少一項)。
+    """
+    try:
+        order_data = _decode_create_order(await request.body())
+    except msgspec.ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except msgspec.DecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="無效的 JSON 請求主體")
+
+    cursor = db.cursor()
+    try:
+        await db.begin()
+
+        user_id = order_data.user_id
+        # 生成唯一的訂單號：time_ns + 序號取代 urandom 系統呼叫與 datetime 格式化
+        seq = next(_ORDER_SEQ) & 0xFFFF
+        order_number = f"{_ORDER_PREFIX}{time.time_ns():016x}{seq:04x}"
+
+        # 彙總各產品需求量 (同一產品可能出現在多個項目中)，並依 id 排序以避免死鎖
+        quantities: Dict[int, int] = {}
+        for item in order_data.items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        product_ids = sorted(quantities)
+
+        # 非鎖定預檢：取得價格與狀態即可，庫存的正確性由後面的條件式 UPDATE 保證
+        await cursor.execute(_select_products_sql(len(product_ids)), product_ids)
+        products = {row[0]: row for row in await cursor.fetchall()}
+
+        # 在 Python 端預先驗證庫存並計算金額 (提早回報友善錯誤；最終以 UPDATE 守衛為準)
+        total_amount = 0.0
+        item_rows = []
+        for product_id in product_ids:
+            quantity = quantities[product_id]
+            product = products.get(product_id)
+
+            if not product:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"產品 ID {product_id} 不存在")
+
+            product_stock, product_price, is_deleted = product[1], product[2], product[3] # 透過索引存取非字典游標
+
+            if is_deleted:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"產品 ID {product_id} 已停用或刪除")
+
+            if product_stock < quantity:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"產品 ID {product_id} 庫存不足。可用: {product_stock}, 需求: {quantity}")
+
+            unit_price = float(product_price)
+            subtotal = unit_price * quantity
+            total_amount += subtotal
+            item_rows.append((product_id, quantity, unit_price, subtotal))
+
+        # 總金額已算出，插入 orders 時一併寫入，免去事後的補寫 UPDATE
+        await cursor.execute(SQL_INSERT_ORDER, (user_id, order_number, total_amount))
+        order_id = cursor.lastrowid
+        if not order_id:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="無法創建訂單")
+
+        # 以單一多值 INSERT 寫入全部 order_items：不依賴驅動的 executemany 改寫規則，
+        # 確定只有 1 次往返與 1 次解析，redo log 也能整批寫入
+        await cursor.execute(
+            _insert_order_items_sql(len(item_rows)),
+            [v for row in item_rows for v in (order_id, *row)]
+        )
+
+        # 以單一 CASE 運算式原子性扣減所有產品庫存；stock >= 需求量 的守衛取代先前的
+        # SELECT ... FOR UPDATE，每項省去一次鎖定與一次往返，競爭條件由 rowcount 檢查攔截
+        case_params = [v for product_id in product_ids for v in (product_id, quantities[product_id])]
+        await cursor.execute(
+            _update_stock_sql(len(product_ids)),
+            case_params + product_ids + case_params
+        )
+        if cursor.rowcount != len(product_ids):
+            # 預檢之後若有並發請求搶先扣減庫存，守衛會使部分行未被更新，在此回滾
+            await db.rollback() # 在拋出異常前明確回滾
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="庫存更新失敗，可能庫存不足或並發問題")
+
+        # 同一事務內遞增反正規化的訂單計數器，供統計與分頁總數 O(1) 讀取
+        await cursor.execute(SQL_BUMP_ORDER_COUNTER, (total_amount,))
+
+        await db.commit()
+        _bump_products_cache_version()  # 庫存已變動，使產品列表快取失效
+        return {"order_id": order_id, "order_number": order_number}
+
+    except HTTPException as e:
+        await db.rollback()
+        raise e # 重新拋出 FastAPI HTTPException
+    except Error as e:
+        await db.rollback()
+        logger.exception("訂單創建期間的資料庫錯誤")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"伺服器錯誤: 無法創建訂單。詳細錯誤: {e}" # 開發環境中更詳細，生產環境中更通用
+        )
+    except Exception as e:
+        await db.rollback()
+        logger.exception("訂單創建期間發生意外錯誤")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"伺服器錯誤: {e}")
+    finally:
+        await cursor.close()
+
+
+@app.put("/api/orders/{order_id}/status", summary="更新訂單狀態")
+async def update_order_status(order_id: int, status_data: UpdateOrderStatusRequest, db: asyncmy.Connection = Depends(get_db)):
+    """
+    更新特定訂單的狀態。
+    允許的狀態: 'pending'、'processing'、'shipped'、'delivered'、'cancelled'。
+    """
+    try:
+        async with db.cursor() as cursor:
+            await cursor.execute(SQL_UPDATE_ORDER_STATUS, (status_data.status, order_id))
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="訂單不存在或狀態已是目標狀態")
+            await db.commit()
+        return {"success": True, "message": "訂單狀態更新成功"}
+    except Error:
+        await db.rollback()
+        logger.exception("更新訂單狀態時發生資料庫錯誤")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="伺服器錯誤: 無法更新訂單狀態")
+
+
+@app.get("/api/products", response_model=ProductListResponse, summary="獲取分頁的產品列表")
+async def get_products(page: int = Query(1, gt=0, description="頁碼"), limit: int = Query(50, gt=0, le=200, description="每頁筆數"), after_id: Optional[int] = None, include_total: bool = False, db: asyncmy.Connection = Depends(get_db)):
+    """
+    擷取活躍產品 (is_deleted = FALSE) 的分頁列表。
+    傳入 after_id 可改用游標分頁：只回傳 id 小於 after_id 的產品與 next_cursor。
+    需要總數/總頁數的客戶端請帶 include_total=true，預設省略總數查詢。
+    page/limit 的範圍驗證由 Query 約束在進入處理函數前完成，limit 上限 200。
+    """
+    offset = (page - 1) * limit
+
+    # 快取鍵包含版本號：訂單成立 (庫存變動) 後版本號遞增，舊項目自然失效
+    cache_key = (_products_cache_version, page, limit, after_id, include_total)
+    cached = _products_cache.get(cache_key)
+    if cached is not None and time.monotonic() < cached[0]:
+        return ORJSONResponse(cached[1])
+
+    try:
+        if after_id is not None:
+            # 游標 (keyset) 分頁：走 (is_deleted, id) 複合索引的範圍查詢
+            async with db.cursor() as cursor:
+                await cursor.execute(SQL_PRODUCTS_KEYSET, (after_id, limit))
+                rows = await cursor.fetchall()
+
+            payload = {
+                "data": [_product_row(r) for r in rows],
+                "page": page,
+                "total_pages": None,
+                "total_items": None,
+                "next_cursor": rows[-1][0] if rows else None
+            }
+            _store_products_cache(cache_key, payload)
+            return ORJSONResponse(payload)
+
+        async with db.cursor() as cursor:
+            # include_total 時以窗口函數一次取得分頁資料與活躍產品總數，否則完全跳過計數
+            await cursor.execute(
+                SQL_PRODUCTS_PAGE if include_total else SQL_PRODUCTS_PAGE_NO_TOTAL,
+                (limit, offset)
+            )
+            rows = await cursor.fetchall()
+
+        total_items = total_pages = None
+        if include_total:
+            total_items = int(rows[0][4]) if rows else 0
+            total_pages = ceil(total_items / limit) if total_items > 0 else 0
+
+        payload = {
+            "data": [_product_row(r) for r in rows],
+            "page": page,
+            "total_pages": total_pages,
+            "total_items": total_items,
+            "next_cursor": None
+        }
+        _store_products_cache(cache_key, payload)
+        return ORJSONResponse(payload)
+    except Error:
+        logger.exception("獲取產品列表時發生資料庫錯誤")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="伺服器錯誤: 無法獲取產品列表")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # 明確指定 uvloop 事件迴圈與 httptools 解析器，並依 CPU 核心數啟動多個 worker；
+    # 連線池在 startup 事件中建立，因此每個 worker 行程各自擁有一個池
+    # (多 worker 時請以 DB_POOL_SIZE 控制單一池的大小，避免總連線數超過 MySQL 上限)
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("APP_HOST", "0.0.0.0"),
+        port=int(os.getenv("APP_PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        access_log=False  # 存取日誌屬於熱路徑 I/O，交由前置的反向代理記錄
+    )